@@ -5,10 +5,57 @@ Reads from workflow variables or falls back to hardcoded defaults
 """
 
 import os
-import json
-import plistlib
-from pathlib import Path
+import marshal
+from functools import lru_cache
 
+# Plist value elements other than <string> that can appear under 'variables'
+_PLIST_SCALARS = {
+    'true': lambda el: True,
+    'false': lambda el: False,
+    'integer': lambda el: int(el.text),
+}
+
+def _parse_plist_variables(info_plist):
+    """Parse the 'variables' dict out of info.plist, with lxml when it is installed"""
+    try:
+        from lxml import etree
+    except ImportError:
+        import plistlib
+        with open(info_plist, 'rb') as f:
+            return plistlib.load(f).get('variables', {})
+    
+    tree = etree.parse(str(info_plist))
+    variables = {}
+    for key in tree.xpath("/plist/dict/key[.='variables']/following-sibling::dict[1]/key"):
+        value = key.xpath('following-sibling::*[1]')
+        if not value:
+            continue
+        convert = _PLIST_SCALARS.get(value[0].tag)
+        variables[key.text] = convert(value[0]) if convert else (value[0].text or '')
+    return variables
+
+def load_plist_variables(info_plist, cache_path):
+    """Load the workflow variables from info.plist, cached by mtime in a marshal sidecar"""
+    mtime = os.stat(info_plist).st_mtime
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_mtime, variables = marshal.load(f)
+        if cached_mtime == mtime:
+            return variables
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    
+    variables = _parse_plist_variables(info_plist)
+    
+    try:
+        with open(cache_path, 'wb') as f:
+            marshal.dump((mtime, variables), f)
+    except (OSError, ValueError):
+        pass
+    return variables
+
+# Read once per process; every module shares the same result
+@lru_cache(maxsize=1)
 def get_config():
     """Get configuration from workflow info.plist or environment"""
     config = {
@@ -20,22 +67,23 @@ def get_config():
     }
     
     # If environment variables are not set, try to read from info.plist
+    # plistlib and pathlib are only imported on this path to keep startup cheap
     if not config['host'] or not config['token_id']:
+        from pathlib import Path
+        
         script_dir = Path(__file__).parent.absolute()
         info_plist = script_dir / 'info.plist'
         
         if info_plist.exists():
             try:
-                with open(info_plist, 'rb') as f:
-                    plist = plistlib.load(f)
-                    variables = plist.get('variables', {})
-                    
-                    config['host'] = variables.get('PVE_HOST', config['host'])
-                    config['port'] = variables.get('PVE_PORT', config['port'])
-                    config['token_id'] = variables.get('PVE_TOKEN_ID', config['token_id'])
-                    config['token_secret'] = variables.get('PVE_TOKEN_SECRET', config['token_secret'])
-                    verify_ssl_str = variables.get('PVE_VERIFY_SSL', 'false')
-                    config['verify_ssl'] = verify_ssl_str.lower() == 'true'
+                variables = load_plist_variables(info_plist, script_dir / '.info.plist.cache')
+                
+                config['host'] = variables.get('PVE_HOST', config['host'])
+                config['port'] = variables.get('PVE_PORT', config['port'])
+                config['token_id'] = variables.get('PVE_TOKEN_ID', config['token_id'])
+                config['token_secret'] = variables.get('PVE_TOKEN_SECRET', config['token_secret'])
+                verify_ssl_str = variables.get('PVE_VERIFY_SSL', 'false')
+                config['verify_ssl'] = verify_ssl_str.lower() == 'true'
             except Exception:
                 pass
     
@@ -3,45 +3,23 @@
 List Snapshots - Shows available snapshots for rollback
 """
 
-import json
-import ssl
 import os
-import urllib.request
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def get_config():
-    """Get config from environment variables (set by Alfred at runtime)"""
-    return {
-        'host': os.environ.get('PVE_HOST', ''),
-        'port': os.environ.get('PVE_PORT', '8006'),
-        'token_id': os.environ.get('PVE_TOKEN_ID', ''),
-        'token_secret': os.environ.get('PVE_TOKEN_SECRET', ''),
-    }
+from proxmox_api import ProxmoxAPI, print_items
+from status_cache import read_status_cache, write_status_cache
 
-def api_request(method, endpoint):
-    """Make API request to Proxmox"""
-    cfg = get_config()
-    url = f"https://{cfg['host']}:{cfg['port']}/api2/json{endpoint}"
-    
-    ssl_ctx = ssl.create_default_context()
-    ssl_ctx.check_hostname = False
-    ssl_ctx.verify_mode = ssl.CERT_NONE
-    
-    headers = {
-        'Authorization': f"PVEAPIToken={cfg['token_id']}={cfg['token_secret']}"
-    }
-    
-    req = urllib.request.Request(url, headers=headers, method=method)
-    with urllib.request.urlopen(req, context=ssl_ctx, timeout=10) as resp:
-        return json.loads(resp.read().decode('utf-8'))
+# The snapshot list opens right after vm_actions fetched the status, so reuse one this recent
+STATUS_CACHE_TTL = 3
 
 def format_timestamp(snaptime):
     """Format snapshot timestamp to readable date"""
     if not snaptime:
         return ""
     try:
-        dt = datetime.fromtimestamp(snaptime)
-        return dt.strftime("%Y-%m-%d %H:%M")
+        tm = time.localtime(snaptime)
+        return f"{tm.tm_year:04d}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{tm.tm_min:02d}"
     except:
         return ""
 
@@ -58,7 +36,7 @@ def main():
             'subtitle': f'vm_context: {vm_context[:50] if vm_context else "(empty)"}',
             'valid': False
         })
-        print(json.dumps({'items': items}))
+        print_items(items)
         return
     
     parts = vm_context.split(':')
@@ -68,7 +46,7 @@ def main():
             'subtitle': f'Expected rollback:node:type:vmid:name, got: {vm_context[:50]}',
             'valid': False
         })
-        print(json.dumps({'items': items}))
+        print_items(items)
         return
     
     node = parts[1]
@@ -77,20 +55,31 @@ def main():
     name = ':'.join(parts[4:])  # Name might contain colons
     
     try:
+        api = ProxmoxAPI()
+        
+        current_status = read_status_cache(vmid, STATUS_CACHE_TTL)
+        if current_status:
+            snapshots = api.get_snapshots(node, vmtype, vmid)
+        else:
+            # The status check and the snapshot list are independent, so fetch them concurrently
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                status_future = executor.submit(api.get_vm_status, node, vmtype, vmid)
+                snapshots_future = executor.submit(api.get_snapshots, node, vmtype, vmid)
+                
+                current_status = status_future.result().get('status', 'unknown')
+                snapshots = snapshots_future.result()
+            
+            if current_status != 'unknown':
+                write_status_cache(vmid, current_status)
+        
         # Check if VM is currently running
-        status_endpoint = f"/nodes/{node}/{vmtype}/{vmid}/status/current"
-        status_result = api_request('GET', status_endpoint)
-        current_status = status_result.get('data', {}).get('status', 'unknown')
         is_running = current_status == 'running'
         
-        # Get snapshots
-        endpoint = f"/nodes/{node}/{vmtype}/{vmid}/snapshot"
-        result = api_request('GET', endpoint)
-        snapshots = result.get('data', [])
-        
         # Filter out 'current' and sort by timestamp (newest first)
-        real_snapshots = [s for s in snapshots if s.get('name') != 'current']
-        real_snapshots.sort(key=lambda x: x.get('snaptime', 0), reverse=True)
+        real_snapshots = sorted(
+            (s for s in snapshots if s.get('name') != 'current'),
+            key=lambda s: -(s.get('snaptime') or 0)
+        )
         
         if not real_snapshots:
             items.append({
@@ -149,7 +138,7 @@ def main():
             'valid': False
         })
     
-    print(json.dumps({'items': items}))
+    print_items(items)
 
 if __name__ == '__main__':
     main()
@@ -4,15 +4,17 @@ PVE Manager - Alfred Script Filter
 Lists VMs and Containers with polished emoji UI
 """
 
-import json
 import sys
 import os
-import ssl
-import urllib.request
-from pathlib import Path
+import time
+
+from config import get_config
+from proxmox_api import UNVERIFIED_SSL_CONTEXT, ProxmoxAPIError, _json, print_items, raw_get
 
 def get_usage_file():
     """Get path to usage data file in Alfred's workflow data directory"""
+    from pathlib import Path
+    
     # Alfred provides workflow data directory via env var
     data_dir = os.environ.get('alfred_workflow_data', '')
     # Only use Alfred's data dir if it's for our workflow
@@ -24,56 +26,147 @@ def get_usage_file():
 
 def load_usage_counts():
     """Load usage counts from file"""
-    usage_file = get_usage_file()
-    if usage_file.exists():
+    try:
+        with open(get_usage_file(), 'rb') as f:
+            return _json.loads(f.read())
+    except (ValueError, OSError):
+        return {}
+
+# Alfred re-runs the script on every keystroke, so reuse a very recent response
+RESOURCES_CACHE_TTL = 2.0
+
+def get_resources_cache_file():
+    """Get path to the cached /cluster/resources response"""
+    from pathlib import Path
+    
+    data_dir = os.environ.get('alfred_workflow_data', '')
+    if data_dir and 'com.pve.manager' in data_dir:
+        Path(data_dir).mkdir(parents=True, exist_ok=True)
+        return Path(data_dir) / 'resources.cache'
+    return Path(__file__).parent.absolute() / 'resources.cache'
+
+def read_resources_cache(cache_file):
+    """Return the cached response bytes if still fresh, else None"""
+    try:
+        if time.time() - cache_file.stat().st_mtime < RESOURCES_CACHE_TTL:
+            return cache_file.read_bytes()
+    except OSError:
+        pass
+    return None
+
+def write_resources_cache(cache_file, raw):
+    """Store the raw response bytes for the next keystroke"""
+    # Alfred may kill this run when the next keystroke arrives, so write a temp
+    # file and rename it over the cache rather than leave a truncated one behind.
+    # The temp name is per process, so overlapping runs never rename each other's file
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    try:
+        tmp_file.write_bytes(raw)
+        os.replace(tmp_file, cache_file)
+    except OSError:
         try:
-            with open(usage_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
+            os.unlink(tmp_file)
+        except OSError:
             pass
-    return {}
 
-def get_config():
-    """Get config from environment variables (set by Alfred at runtime)"""
-    # Alfred passes workflow variables as environment variables
-    # This ensures configuration changes in Alfred's UI are respected
-    return {
-        'host': os.environ.get('PVE_HOST', ''),
-        'port': os.environ.get('PVE_PORT', '8006'),
-        'token_id': os.environ.get('PVE_TOKEN_ID', ''),
-        'token_secret': os.environ.get('PVE_TOKEN_SECRET', ''),
-    }
+def drop_resources_cache():
+    """Forget the cached response, e.g. after run_action changed a VM's power state"""
+    try:
+        os.unlink(get_resources_cache_file())
+    except OSError:
+        pass
+
+_BYTE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
 
 def format_bytes(bytes_val):
     """Format bytes to human readable"""
     if not bytes_val:
         return "0B"
-    if bytes_val < 1024:
+    bytes_val = int(bytes_val)
+    # Each unit is 2**10 of the previous one, so the bit length picks it directly
+    # Clamp below too: values under 1 truncate to 0, whose bit length gives -1
+    idx = max(0, min(len(_BYTE_UNITS) - 1, (bytes_val.bit_length() - 1) // 10))
+    if idx == 0:
         return f"{bytes_val}B"
-    elif bytes_val < 1024**2:
-        return f"{bytes_val/1024:.0f}KB"
-    elif bytes_val < 1024**3:
-        return f"{bytes_val/1024**2:.1f}MB"
-    else:
-        return f"{bytes_val/1024**3:.1f}GB"
-
-def get_status_emoji(status):
-    """Get status emoji"""
-    return {
-        'running': '🟢',
-        'stopped': '🔴',
-        'paused': '🟡',
-        'suspended': '🟠'
-    }.get(status, '⚪')
+    value = bytes_val / (1 << (idx * 10))
+    return f"{value:.0f}{_BYTE_UNITS[idx]}" if idx == 1 else f"{value:.1f}{_BYTE_UNITS[idx]}"
+
+# Precomputed lookups for the per-VM output loop
+_STATUS_EMOJI = {
+    'running': '🟢',
+    'stopped': '🔴',
+    'paused': '🟡',
+    'suspended': '🟠'
+}
+_TYPE_EMOJI = {'lxc': '📦', 'qemu': '🖥️'}
 
-def get_type_emoji(vmtype):
-    """Get type emoji"""
-    return '📦' if vmtype == 'lxc' else '🖥️'
+def get_search_key(vm):
+    """Case-folded "vmid name" string that the query is matched against"""
+    vmid = vm.get('vmid', '')
+    name = vm['name'] if 'name' in vm else f'VM {vmid}'
+    return f"{vmid} {name}".casefold()
+
+def build_vm_item(vm):
+    """Build the Alfred item for one VM or container"""
+    vmid = vm.get('vmid', '')
+    name = vm['name'] if 'name' in vm else f'VM {vmid}'
+    status = vm.get('status', 'unknown')
+    node = vm.get('node', '')
+    vmtype = vm.get('type', 'qemu')
+    cpu = vm.get('cpu', 0)
+    maxcpu = vm.get('maxcpu', 1)
+    mem = vm.get('mem', 0)
+    status_emoji = _STATUS_EMOJI.get(status, '⚪')
+    type_emoji = _TYPE_EMOJI.get(vmtype, '🖥️')
+    is_running = status == 'running'
+    
+    # Format resources
+    cpu_pct = f"{cpu * 100 / maxcpu:.0f}%" if maxcpu else "N/A"
+    mem_used = format_bytes(mem)
+    
+    # Argument for direct actions (mods) needs to keep the old format
+    full_arg = f"{node}:{vmtype}:{vmid}:{name}"
+    
+    return {
+        'uid': f"pve-{vmid}",
+        # Title with type emoji
+        'title': f"{status_emoji}  {type_emoji}  {vmid} {name}",
+        # Subtitle with status and resources
+        'subtitle': f"{status_emoji} {status.capitalize()}  •  CPU: {cpu_pct}  •  RAM: {mem_used}",
+        # Variables for the next script filter
+        'variables': {'node': node, 'type': vmtype, 'vmid': str(vmid), 'name': name},
+        'arg': '',  # Clear arg so the next script filter has a clean search box
+        'autocomplete': name,
+        'icon': {'path': 'icon.png'},
+        'mods': {
+            'cmd': {
+                'subtitle': f"🔄 Restart {name}" if is_running else f"▶️ Start {name}",
+                'arg': f"restart:{full_arg}" if is_running else f"start:{full_arg}",
+                'valid': True
+            },
+            'alt': {
+                'subtitle': "🖥️ Open Console in Browser",
+                'arg': f"console:{full_arg}",
+                'valid': True
+            },
+            # Dynamic modifier based on status
+            'ctrl': {
+                'subtitle': f"⏹️ Stop {name}" if is_running else f"▶️ Start {name}",
+                'arg': f"stop:{full_arg}" if is_running else f"start:{full_arg}",
+                'valid': True
+            },
+            'shift': {
+                'subtitle': f"⏻ Graceful Shutdown {name}",
+                'arg': f"shutdown:{full_arg}",
+                'valid': True
+            }
+        }
+    }
 
 def main():
     items = []
     raw_query = sys.argv[1] if len(sys.argv) > 1 else ''
-    query = '' if raw_query in ['{query}', '(null)', 'null', None] else raw_query.lower().strip()
+    query = '' if raw_query in ['{query}', '(null)', 'null', None] else raw_query.strip().casefold()
     
     try:
         cfg = get_config()
@@ -89,121 +182,59 @@ def main():
                 'valid': False
             })
         else:
-            url = f"https://{host}:{port}/api2/json/cluster/resources"
+            cache_file = get_resources_cache_file()
+            raw = read_resources_cache(cache_file)
+            data = None
             
-            ssl_ctx = ssl.create_default_context()
-            ssl_ctx.check_hostname = False
-            ssl_ctx.verify_mode = ssl.CERT_NONE
+            if raw is not None:
+                try:
+                    data = _json.loads(raw)
+                except ValueError:
+                    # An unreadable cache is just a miss
+                    data = None
             
-            headers = {
-                'Authorization': f'PVEAPIToken={token_id}={token_secret}'
-            }
+            if data is None:
+                status, raw = raw_get(
+                    host, port, '/api2/json/cluster/resources',
+                    f'PVEAPIToken={token_id}={token_secret}', UNVERIFIED_SSL_CONTEXT
+                )
+                if status >= 400:
+                    raise ProxmoxAPIError(status, raw.decode('utf-8', 'replace'))
+                data = _json.loads(raw)
+                write_resources_cache(cache_file, raw)
             
-            req = urllib.request.Request(url, headers=headers)
+            resources = data.get('data', [])
+            vms = [r for r in resources if r.get('type') in ('qemu', 'lxc')]
             
-            with urllib.request.urlopen(req, context=ssl_ctx, timeout=10) as resp:
-                data = json.loads(resp.read().decode('utf-8'))
-                resources = data.get('data', [])
-                vms = [r for r in resources if r.get('type') in ('qemu', 'lxc')]
-                
-                # Load usage counts and sort by usage (most used first), then by vmid
-                usage_counts = load_usage_counts()
-                vms.sort(key=lambda x: (-usage_counts.get(str(x.get('vmid', 0)), 0), x.get('vmid', 0)))
-                
-                for vm in vms:
-                    vmid = vm.get('vmid', '')
-                    name = vm.get('name', f'VM {vmid}')
-                    status = vm.get('status', 'unknown')
-                    node = vm.get('node', '')
-                    vmtype = vm.get('type', 'qemu')
-                    
-                    # Filter by query
-                    search_str = f"{vmid} {name}".lower()
-                    if query and query not in search_str:
-                        continue
-                    
-                    # Format resources
-                    cpu = vm.get('cpu', 0)
-                    maxcpu = vm.get('maxcpu', 1)
-                    mem = vm.get('mem', 0)
-                    
-                    cpu_pct = f"{cpu * 100 / maxcpu:.0f}%" if maxcpu else "N/A"
-                    mem_used = format_bytes(mem)
-                    
-                    status_emoji = get_status_emoji(status)
-                    type_emoji = get_type_emoji(vmtype)
-                    type_label = 'Container' if vmtype == 'lxc' else 'VM'
-                    
-                    # Title with type emoji
-                    title = f"{status_emoji}  {type_emoji}  {vmid} {name}"
-                    
-                    # Subtitle with status and resources
-                    subtitle = f"{status_emoji} {status.capitalize()}  •  CPU: {cpu_pct}  •  RAM: {mem_used}"
-                    
-                    # Variables for the next script filter
-                    variables = {
-                        'node': node,
-                        'type': vmtype,
-                        'vmid': str(vmid),
-                        'name': name
-                    }
-                    
-                    # Argument for direct actions (mods) needs to keep the old format
-                    full_arg = f"{node}:{vmtype}:{vmid}:{name}"
-                    
-                    # Dynamic modifier based on status
-                    start_stop = {
-                        'subtitle': f"{'⏹️ Stop' if status == 'running' else '▶️ Start'} {name}",
-                        'arg': f"{'stop' if status == 'running' else 'start'}:{full_arg}",
-                        'valid': True
-                    }
-                    
+            # Filter by query up front so sorting and formatting only see matching VMs
+            if query:
+                vms = [vm for vm in vms if get_search_key(vm).find(query) >= 0]
+            
+            # Load usage counts and sort by usage (most used first), then by vmid
+            usage_counts = load_usage_counts()
+            # Decorate once so the sort compares plain tuples instead of calling a key per item
+            decorated = [(-usage_counts.get(str(vm.get('vmid', 0)), 0), vm.get('vmid', 0), i, vm) for i, vm in enumerate(vms)]
+            decorated.sort()
+            items = [build_vm_item(d[3]) for d in decorated]
+            
+            if not items:
+                if query:
+                    items.append({
+                        'title': f'🔍  No matches for "{query}"',
+                        'subtitle': 'Try a different search term',
+                        'valid': False
+                    })
+                else:
                     items.append({
-                        'uid': f"pve-{vmid}",
-                        'title': title,
-                        'subtitle': subtitle,
-                        'variables': variables,
-                        'arg': '',  # Clear arg so the next script filter has a clean search box
-                        'autocomplete': name,
-                        'icon': {'path': 'icon.png'},
-                        'mods': {
-                            'cmd': {
-                                'subtitle': f"🔄 Restart {name}" if status == 'running' else f"▶️ Start {name}",
-                                'arg': f"restart:{full_arg}" if status == 'running' else f"start:{full_arg}",
-                                'valid': True
-                            },
-                            'alt': {
-                                'subtitle': f"🖥️ Open Console in Browser",
-                                'arg': f"console:{full_arg}",
-                                'valid': True
-                            },
-                            'ctrl': start_stop,
-                            'shift': {
-                                'subtitle': f"⏻ Graceful Shutdown {name}",
-                                'arg': f"shutdown:{full_arg}",
-                                'valid': True
-                            }
-                        }
+                        'title': '📭  No VMs or containers found',
+                        'subtitle': 'Your Proxmox server has no VMs or containers',
+                        'valid': False
                     })
                 
-                if not items:
-                    if query:
-                        items.append({
-                            'title': f'🔍  No matches for "{query}"',
-                            'subtitle': 'Try a different search term',
-                            'valid': False
-                        })
-                    else:
-                        items.append({
-                            'title': '📭  No VMs or containers found',
-                            'subtitle': 'Your Proxmox server has no VMs or containers',
-                            'valid': False
-                        })
-                    
-    except urllib.error.URLError as e:
+    except OSError as e:
         items.append({
             'title': '🔌  Connection Failed',
-            'subtitle': f"Could not reach Proxmox: {str(e.reason)[:60]}",
+            'subtitle': f"Could not reach Proxmox: {str(e)[:60]}",
             'valid': False
         })
     except Exception as e:
@@ -213,7 +244,7 @@ def main():
             'valid': False
         })
     
-    print(json.dumps({'items': items}))
+    print_items(items)
 
 if __name__ == '__main__':
     main()
@@ -4,12 +4,28 @@ Proxmox VE API Client for Alfred Workflow
 Handles authentication and API calls to Proxmox VE
 """
 
-import urllib.request
-import urllib.parse
-import json
 import ssl
 import os
+import socket
 import sys
+import threading
+
+# Prefer a faster JSON parser when one is installed; all of them accept bytes.
+# The script filters import _json from here rather than repeating this fallback
+try:
+    import orjson as _json
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import json as _json
+
+# Certificate checks are off unless PVE_VERIFY_SSL is set. Built once, and an
+# unverified context never loads the system CA bundle
+UNVERIFIED_SSL_CONTEXT = ssl._create_unverified_context()
+
+# http.client, urllib and httpx are imported where they are used, so scripts
+# that only need raw_get() don't pay for loading them
 
 # Add script directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -17,6 +33,82 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from config import get_config
 
 
+def _import_httpx():
+    """Import httpx for HTTP/2 support, or return None if it or its h2 extra is missing"""
+    try:
+        import httpx
+        import h2  # noqa: F401 - required by httpx for http2=True
+    except ImportError:
+        return None
+    return httpx
+
+
+def _decode_chunked(body):
+    """Decode a chunked transfer-encoded response body"""
+    decoded = []
+    while body:
+        size_line, _, rest = body.partition(b'\r\n')
+        size = int(size_line.split(b';', 1)[0], 16)
+        if size == 0:
+            break
+        decoded.append(rest[:size])
+        body = rest[size + 2:]
+    return b''.join(decoded)
+
+
+def print_items(items):
+    """Write the Alfred script filter JSON to stdout as raw bytes"""
+    output = _json.dumps({'items': items})
+    # orjson returns bytes, stdlib json and ujson return str
+    if isinstance(output, str):
+        output = output.encode('utf-8')
+    sys.stdout.buffer.write(output)
+
+
+def raw_get(host, port, path, authorization, ssl_context, timeout=10):
+    """
+    One-shot HTTPS GET over a plain TLS socket, returns (status, body).
+    Avoids importing urllib/http.client for scripts that make a single request.
+    """
+    request = (
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        f"Authorization: {authorization}\r\n"
+        "Accept: application/json\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+    ).encode('utf-8')
+    
+    chunks = []
+    with socket.create_connection((host, int(port)), timeout=timeout) as raw_sock:
+        with ssl_context.wrap_socket(raw_sock, server_hostname=host) as sock:
+            sock.sendall(request)
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+    
+    head, _, body = b''.join(chunks).partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('iso-8859-1').split('\r\n')
+    status = int(status_line.split(' ', 2)[1])
+    
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'transfer-encoding' and 'chunked' in value.lower():
+            body = _decode_chunked(body)
+            break
+    return status, body
+
+
+class ProxmoxAPIError(Exception):
+    """Proxmox answered with an HTTP error status"""
+    def __init__(self, status, body):
+        super().__init__(f"API Error {status}: {body}")
+        self.status = status
+        self.body = body
+
+
 class ProxmoxAPI:
     def __init__(self):
         config = get_config()
@@ -32,32 +124,112 @@ class ProxmoxAPI:
         if self.verify_ssl:
             self.ssl_context = ssl.create_default_context()
         else:
-            self.ssl_context = ssl.create_default_context()
-            self.ssl_context.check_hostname = False
-            self.ssl_context.verify_mode = ssl.CERT_NONE
+            self.ssl_context = UNVERIFIED_SSL_CONTEXT
+        
+        # One kept-alive connection per thread, so only the first request on each
+        # thread pays the TCP + TLS handshake and concurrent calls don't collide
+        self._local = threading.local()
+        
+        # With HTTP/2 a single client multiplexes concurrent calls over one connection.
+        # It is built on the first request, so runs that never call the API don't import httpx
+        self._client = None
+        self._client_checked = False
+        self._client_lock = threading.Lock()
+    
+    def _get_client(self):
+        """Get the shared httpx client, creating it on first use; None if httpx is unavailable"""
+        if not self._client_checked:
+            with self._client_lock:
+                if not self._client_checked:
+                    httpx = _import_httpx()
+                    if httpx is not None:
+                        self._client = httpx.Client(http2=True, verify=self.ssl_context, timeout=10)
+                    self._client_checked = True
+        return self._client
+    
+    def _get_connection(self):
+        """Get this thread's kept-alive HTTPS connection, opening it on first use"""
+        import http.client
+        
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPSConnection(
+                self.host, int(self.port), context=self.ssl_context, timeout=10
+            )
+        return conn
+    
+    def _drop_connection(self):
+        """Close this thread's connection so the next request opens a fresh one"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
+    def close(self):
+        """Close this thread's connection and the HTTP/2 client, if any"""
+        self._drop_connection()
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._client_checked = False
+    
+    def _send_http2(self, client, method, endpoint, body, headers):
+        """Send a request through the shared httpx client, returns (status, reason, body)"""
+        import httpx
+        
+        try:
+            response = client.request(method, f"{self.base_url}{endpoint}", content=body, headers=headers)
+        except httpx.HTTPError as e:
+            raise Exception(f"Connection Error: {e}")
+        return response.status_code, response.reason_phrase, response.content
+    
+    def _send_http11(self, method, endpoint, body, headers):
+        """Send a request over this thread's kept-alive connection, returns (status, reason, body)"""
+        import http.client
+        
+        path = f"/api2/json{endpoint}"
+        while True:
+            reused = getattr(self._local, 'conn', None) is not None
+            conn = self._get_connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.reason, response.read()
+            except (ConnectionResetError, BrokenPipeError) as e:
+                self._drop_connection()
+                # The server may have dropped an idle keep-alive connection; retry once on a fresh one
+                if not reused:
+                    raise Exception(f"Connection Error: {e}")
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection()
+                raise Exception(f"Connection Error: {e}")
     
     def _request(self, method, endpoint, data=None):
         """Make an API request to Proxmox"""
-        url = f"{self.base_url}{endpoint}"
-        
         headers = {
             'Authorization': f'PVEAPIToken={self.token_id}={self.token_secret}',
             'Content-Type': 'application/x-www-form-urlencoded'
         }
         
         if data:
-            data = urllib.parse.urlencode(data).encode('utf-8')
+            from urllib.parse import quote_plus
+            # Keys are fixed ASCII parameter names, only the values need quoting
+            data = '&'.join(f"{k}={quote_plus(str(v))}" for k, v in data.items()).encode('ascii')
         
-        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        client = self._get_client()
+        if client is not None:
+            status, reason, body = self._send_http2(client, method, endpoint, data, headers)
+        else:
+            status, reason, body = self._send_http11(method, endpoint, data, headers)
         
-        try:
-            with urllib.request.urlopen(req, context=self.ssl_context, timeout=10) as response:
-                return json.loads(response.read().decode('utf-8'))
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8') if e.fp else str(e)
-            raise Exception(f"API Error {e.code}: {error_body}")
-        except urllib.error.URLError as e:
-            raise Exception(f"Connection Error: {e.reason}")
+        if status >= 400:
+            error_body = body.decode('utf-8', 'replace') or reason
+            raise ProxmoxAPIError(status, error_body)
+        return _json.loads(body)
+    
+    def request(self, method, endpoint, data=None):
+        """Make an API request to an endpoint that has no dedicated method"""
+        return self._request(method, endpoint, data)
     
     def get_resources(self, resource_type=None):
         """Get all VMs and containers"""
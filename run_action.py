@@ -6,17 +6,23 @@ With real-time task polling and confirmation notifications
 
 import json
 import sys
-import ssl
+import re
 import time
-import urllib.request
 import urllib.parse
-import plistlib
 import subprocess
-import webbrowser
 import os
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from proxmox_api import ProxmoxAPI
+from config import get_config
+from list_vms import drop_resources_cache
+from proxmox_api import ProxmoxAPI, ProxmoxAPIError
+from status_cache import drop_status_cache
 
+# Snapshots created by this workflow are named snap1, snap2, ...
+_SNAP_RE = re.compile(r'^snap(\d+)$')
+
+@lru_cache(maxsize=1)
 def get_usage_file():
     """Get path to usage data file in Alfred's workflow data directory"""
     data_dir = os.environ.get('alfred_workflow_data', '')
@@ -27,26 +33,34 @@ def get_usage_file():
     # Fallback to script directory
     return Path(__file__).parent.absolute() / 'usage.json'
 
-def increment_usage(vmid):
-    """Increment usage count for a VM/container"""
-    usage_file = get_usage_file()
-    counts = {}
-    if usage_file.exists():
-        try:
-            with open(usage_file, 'r') as f:
-                counts = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    
-    vmid_str = str(vmid)
-    counts[vmid_str] = counts.get(vmid_str, 0) + 1
+def _load_counts(usage_file):
+    """Load a usage counter file, or an empty dict if it is missing or unreadable"""
+    try:
+        with open(usage_file, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return {}
+
+def _bump_count(usage_file, key):
+    """Increment one counter and write the file back atomically"""
+    counts = _load_counts(usage_file)
+    counts[key] = counts.get(key, 0) + 1
     
+    # Write to a temp file and rename over the original, so a killed run can't
+    # leave a truncated file behind (which would reset every count). The temp
+    # name is per process, so overlapping runs never rename each other's file
+    tmp_file = usage_file.with_name(f"{usage_file.name}.{os.getpid()}.tmp")
     try:
-        with open(usage_file, 'w') as f:
-            json.dump(counts, f)
+        with open(tmp_file, 'w') as f:
+            json.dump(counts, f, separators=(',', ':'))
+        os.replace(tmp_file, usage_file)
     except IOError:
-        pass
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
 
+@lru_cache(maxsize=1)
 def get_action_usage_file():
     """Get path to action usage data file"""
     data_dir = os.environ.get('alfred_workflow_data', '')
@@ -55,81 +69,75 @@ def get_action_usage_file():
         return Path(data_dir) / 'action_usage.json'
     return Path(__file__).parent.absolute() / 'action_usage.json'
 
-def increment_action_usage(action):
-    """Increment usage count for an action"""
-    usage_file = get_action_usage_file()
-    counts = {}
-    if usage_file.exists():
-        try:
-            with open(usage_file, 'r') as f:
-                counts = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    
-    counts[action] = counts.get(action, 0) + 1
-    
-    try:
-        with open(usage_file, 'w') as f:
-            json.dump(counts, f)
-    except IOError:
-        pass
+def bump_usage(vmid, action):
+    """Increment the usage counts for a VM/container and an action"""
+    _bump_count(get_usage_file(), str(vmid))
+    _bump_count(get_action_usage_file(), action)
 
-def get_config():
-    """Get config from info.plist"""
-    script_dir = Path(__file__).parent.absolute()
-    info_plist = script_dir / 'info.plist'
-    
-    if info_plist.exists():
-        with open(info_plist, 'rb') as f:
-            plist = plistlib.load(f)
-            variables = plist.get('variables', {})
-            return {
-                'host': variables.get('PVE_HOST', ''),
-                'port': variables.get('PVE_PORT', '8006'),
-                'token_id': variables.get('PVE_TOKEN_ID', ''),
-                'token_secret': variables.get('PVE_TOKEN_SECRET', ''),
-            }
-    return {}
+# One client for the whole run, so the action, snapshot and task-polling requests
+# all share its kept-alive connection and its reconnect rule
+@lru_cache(maxsize=1)
+def get_api():
+    """Get the ProxmoxAPI instance shared by this run"""
+    return ProxmoxAPI()
 
 def api_request(method, endpoint, data=None):
     """Make API request to Proxmox, returns response data"""
-    cfg = get_config()
-    url = f"https://{cfg['host']}:{cfg['port']}/api2/json{endpoint}"
-    
-    ssl_ctx = ssl.create_default_context()
-    ssl_ctx.check_hostname = False
-    ssl_ctx.verify_mode = ssl.CERT_NONE
-    
-    headers = {
-        'Authorization': f"PVEAPIToken={cfg['token_id']}={cfg['token_secret']}",
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
-    
-    if data:
-        data = urllib.parse.urlencode(data).encode('utf-8')
-    
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    return get_api().request(method, endpoint, data)
+
+def _reset_caches():
+    """Forget the memoized config, data-file paths and API client"""
+    get_config.cache_clear()
+    get_usage_file.cache_clear()
+    get_action_usage_file.cache_clear()
+    if get_api.cache_info().currsize:
+        get_api().close()
+    get_api.cache_clear()
+
+def _notify_script(title, message):
+    """Build the AppleScript that triggers Alfred's notification"""
+    notification_text = f"{title}: {message}" if title != "Proxmox" else message
+    notification_escaped = notification_text.replace('\\', '\\\\').replace('"', '\\"')
     
-    with urllib.request.urlopen(req, context=ssl_ctx, timeout=15) as resp:
-        return json.loads(resp.read().decode('utf-8'))
+    return f'tell application id "com.runningwithcrayons.Alfred" to run trigger "notify" in workflow "com.pve.manager" with argument "{notification_escaped}"'
+
+# The osascript still delivering the previous notification, if any
+_pending_notify = None
 
 def notify(title, message, sound=True):
     """Show notification via Alfred's native notification system"""
-    # Use AppleScript to trigger Alfred's external trigger
-    notification_text = f"{title}: {message}" if title != "Proxmox" else message
-    notification_escaped = notification_text.replace('\\', '\\\\').replace('"', '\\"')
+    global _pending_notify
+    # Let the previous notification reach Alfred first, so a fast task's
+    # "completed" can't overtake its "Starting..."
+    if _pending_notify is not None:
+        try:
+            _pending_notify.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            pass
     
-    script = f'tell application id "com.runningwithcrayons.Alfred" to run trigger "notify" in workflow "com.pve.manager" with argument "{notification_escaped}"'
-    subprocess.run(['osascript', '-e', script], capture_output=True)
+    # Use AppleScript to trigger Alfred's external trigger. Nothing reads the result,
+    # so don't wait for osascript; its own session keeps it alive after we exit
+    _pending_notify = subprocess.Popen(
+        ['osascript', '-e', _notify_script(title, message)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    return _pending_notify
 
-def get_task_status(node, upid):
-    """Get the status of a Proxmox task by UPID"""
-    # URL encode the UPID since it contains special characters
-    encoded_upid = urllib.parse.quote(upid, safe='')
-    endpoint = f"/nodes/{node}/tasks/{encoded_upid}/status"
+def open_url(url):
+    """Open a URL in the default browser without waiting for it"""
+    # Calling open directly skips webbrowser's browser detection
+    return subprocess.Popen(['/usr/bin/open', url], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def get_task_status_by_endpoint(endpoint):
+    """Get the status of a Proxmox task from its /tasks/{upid}/status endpoint"""
     result = api_request('GET', endpoint)
     return result.get('data', {})
 
+# Task polling backoff: first sleep, growth factor, and ceiling (seconds)
+POLL_INTERVAL_MIN = 0.05
+POLL_BACKOFF = 1.8
+POLL_INTERVAL_MAX = 2.0
+
 def wait_for_task(node, upid, action_name, vm_name, timeout=120):
     """
     Poll task status until completion.
@@ -137,6 +145,11 @@ def wait_for_task(node, upid, action_name, vm_name, timeout=120):
     """
     start_time = time.time()
     notified_running = False
+    # Most tasks finish quickly, so start polling fast and back off for long ones
+    interval = POLL_INTERVAL_MIN
+    seen_running = False
+    # URL encode the UPID once, since it contains special characters and never changes
+    endpoint = f"/nodes/{node}/tasks/{urllib.parse.quote(upid, safe='')}/status"
     
     while True:
         elapsed = time.time() - start_time
@@ -145,7 +158,7 @@ def wait_for_task(node, upid, action_name, vm_name, timeout=120):
             return False
         
         try:
-            status = get_task_status(node, upid)
+            status = get_task_status_by_endpoint(endpoint)
             task_status = status.get('status', '')
             exit_status = status.get('exitstatus', '')
             
@@ -158,14 +171,37 @@ def wait_for_task(node, upid, action_name, vm_name, timeout=120):
                     notify("Proxmox", f"❌ {action_name} failed: {exit_status}")
                     return False
             
-            # Poll every second
-            time.sleep(1)
+            # Sample tightly again right after the task is first seen running
+            if task_status == 'running' and not seen_running:
+                seen_running = True
+                interval = POLL_INTERVAL_MIN
             
-        except Exception as e:
-            # If we can't get status, wait and retry
-            time.sleep(1)
-    
-    return False
+        except Exception:
+            # A failed status check is retried on the next iteration
+            pass
+        
+        # Poll first, sleep after: tasks that are already done return without waiting
+        time.sleep(interval)
+        interval = min(interval * POLL_BACKOFF, POLL_INTERVAL_MAX)
+
+@dataclass
+class Action:
+    """A parsed action argument: action:node:type:vmid:name[:::extra...]"""
+    action: str
+    node: str
+    vmtype: str
+    vmid: str
+    name: str
+    # Fields after each ::: (snapshot description, or rollback_exec's snapname/was_running/has_vmstate)
+    extras: list = field(default_factory=list)
+
+def parse_action(arg):
+    """Parse the action argument once, returns None if it is malformed"""
+    main_part, *extras = arg.split(':::')
+    parts = main_part.split(':')
+    if len(parts) < 5:
+        return None
+    return Action(parts[0], parts[1], parts[2], parts[3], ':'.join(parts[4:]), extras)
 
 def execute_action_with_tracking(action, node, vmtype, vmid, name):
     """Execute an action and track the task to completion"""
@@ -183,18 +219,24 @@ def execute_action_with_tracking(action, node, vmtype, vmid, name):
     endpoint_action = 'reboot' if action == 'restart' else action
     endpoint = f"/nodes/{node}/{vmtype}/{vmid}/status/{endpoint_action}"
     
-    # Execute the action
-    result = api_request('POST', endpoint)
-    upid = result.get('data', '')
-    
-    if upid:
-        # Notify that action was initiated
-        notify("Proxmox", f"{emoji_label} {name}...", sound=False)
-        # Wait for task completion
-        wait_for_task(node, upid, action_name, name)
-    else:
-        # No UPID returned, just show simple notification
-        notify("Proxmox", f"{emoji_label} {name}...")
+    try:
+        # Execute the action
+        result = api_request('POST', endpoint)
+        upid = result.get('data', '')
+        
+        if upid:
+            # Notify that action was initiated
+            notify("Proxmox", f"{emoji_label} {name}...", sound=False)
+            # Wait for task completion
+            wait_for_task(node, upid, action_name, name)
+        else:
+            # No UPID returned, just show simple notification
+            notify("Proxmox", f"{emoji_label} {name}...")
+    finally:
+        # The power state changed, so neither vm_actions nor list_vms may reuse
+        # what they cached
+        drop_status_cache(vmid)
+        drop_resources_cache()
 
 def main():
     if len(sys.argv) < 2 or not sys.argv[1] or sys.argv[1] in ['{query}', '(null)']:
@@ -203,33 +245,25 @@ def main():
     
     # Parse: action:node:type:vmid:name or action:node:type:vmid:name:::description
     arg = sys.argv[1]
+    parsed = parse_action(arg)
     
-    description = None
-    if ':::' in arg:
-        main_part, description = arg.split(':::', 1)
-        # If description is empty string, make it None
-        if not description:
-            description = None
-        parts = main_part.split(':')
-    else:
-        parts = arg.split(':')
-    
-    if len(parts) < 5:
+    if parsed is None:
         notify("Proxmox Error", f"❌ Invalid format: {arg[:30]}")
         return
     
-    action = parts[0]
-    node = parts[1]
-    vmtype = parts[2]
-    vmid = parts[3]
-    name = ':'.join(parts[4:])
+    action = parsed.action
+    node = parsed.node
+    vmtype = parsed.vmtype
+    vmid = parsed.vmid
+    name = parsed.name
+    # Everything after the first ::: is the description; empty means none
+    description = ':::'.join(parsed.extras) or None
     
     cfg = get_config()
-    api = ProxmoxAPI()
+    api = get_api()
     
     # Track usage for smart ordering
-    increment_usage(vmid)
-    increment_action_usage(action)
+    bump_usage(vmid, action)
     
     try:
         if action == 'ssh':
@@ -244,8 +278,9 @@ def main():
                 do script "{ssh_cmd}"
             end tell
             '''
-            subprocess.run(['osascript', '-e', script], capture_output=True)
-            notify("Proxmox", f"🔗 Opening SSH to {name}")
+            # Open Terminal and notify in one osascript run instead of two
+            notify_script = _notify_script("Proxmox", f"🔗 Opening SSH to {name}")
+            subprocess.run(['osascript', '-e', script, '-e', notify_script], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
             
         elif action == 'rollback':
             # Use osascript to call the External Trigger for snapshot selection
@@ -262,7 +297,7 @@ def main():
                 run trigger "show_snapshots" in workflow "{bundle_id}" with argument "{trigger_arg}"
             end tell
             '''
-            subprocess.run(['osascript', '-e', script])
+            subprocess.run(['osascript', '-e', script], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
             # Don't notify, just open the new view
             
         elif action in ['start', 'stop', 'shutdown', 'restart', 'reboot']:
@@ -274,16 +309,10 @@ def main():
             try:
                 snapshots = api.get_snapshots(node, vmtype, vmid)
                 
-                max_snap_num = 0
-                for snap in snapshots:
-                    snap_name_from_list = snap.get('name', '')
-                    if snap_name_from_list.startswith('snap') and snap_name_from_list[4:].isdigit():
-                        try:
-                            num = int(snap_name_from_list[4:])
-                            if num > max_snap_num:
-                                max_snap_num = num
-                        except ValueError:
-                            pass
+                max_snap_num = max(
+                    (int(m.group(1)) for snap in snapshots if (m := _SNAP_RE.match(snap.get('name', '')))),
+                    default=0
+                )
                 
                 next_snap_num = max_snap_num + 1
                 snap_name = f"snap{next_snap_num}"
@@ -310,7 +339,7 @@ def main():
             cfg = get_config()
             # URL format: #v1:0:=lxc%2F107 or #v1:0:=qemu%2F100
             url = f"https://{cfg['host']}:{cfg['port']}/#v1:0:={vmtype}%2F{vmid}"
-            webbrowser.open(url)
+            open_url(url)
             notify("Proxmox", f"🌐 Opening Web UI for {name}")
         
         elif action == 'console':
@@ -318,34 +347,25 @@ def main():
             cfg = get_config()
             # URL format: #v1:0:=lxc%2F107-:4::::::=consolejs:
             url = f"https://{cfg['host']}:{cfg['port']}/#v1:0:={vmtype}%2F{vmid}-:4::::::=consolejs:"
-            webbrowser.open(url)
+            open_url(url)
             notify("Proxmox", f"🖥️ Opening Console for {name}")
         
         elif action == 'rollback_exec':
             # Rollback to a specific snapshot
             # arg format: rollback_exec:node:type:vmid:name:::snapname:::was_running:::has_vmstate
             try:
-                # Parse the special format with ::: separator
-                # The original parts are: action, node, type, vmid, name
-                # Then we have :::snapname:::was_running:::has_vmstate
-                # We already parsed description from ::: earlier, but let's re-parse fully
-                full_arg = sys.argv[1]
-                triple_parts = full_arg.split(':::')
-                
-                if len(triple_parts) < 4:
+                # parse_action already split off the fields after each :::
+                if len(parsed.extras) < 3:
                     notify("Proxmox Error", f"❌ Invalid rollback format")
                     return
                 
-                # First part contains action:node:type:vmid:name, rest are snapname, was_running, has_vmstate
-                main_parts = triple_parts[0].split(':')
-                snap_name = triple_parts[1]
-                was_running = triple_parts[2].lower() == 'true'
-                has_vmstate = triple_parts[3] == '1'
+                snap_name = parsed.extras[0]
+                was_running = parsed.extras[1].lower() == 'true'
+                has_vmstate = parsed.extras[2] == '1'
                 
-                # Get current status to check if running
-                status_result = api_request('GET', f"/nodes/{node}/{vmtype}/{vmid}/status/current")
-                current_status = status_result.get('data', {}).get('status', 'unknown')
-                currently_running = current_status == 'running'
+                # was_running was sampled when the snapshot list was built, so there is
+                # no need for another status round-trip before rolling back
+                should_start = was_running and not has_vmstate
                 
                 notify("Proxmox", f"⏪ Rolling back {name} to '{snap_name}'...", sound=False)
                 
@@ -357,11 +377,15 @@ def main():
                     success = wait_for_task(node, upid, f"Rollback to '{snap_name}'", name)
                     
                     # If rollback was successful, was running before, and snapshot doesn't have RAM state, start it
-                    if success and (was_running or currently_running) and not has_vmstate:
-                        # Wait a moment for rollback to fully complete
-                        time.sleep(1)
+                    if success and should_start:
                         notify("Proxmox", f"▶️ Starting {name} after rollback...", sound=False)
-                        start_result = api_request('POST', f"/nodes/{node}/{vmtype}/{vmid}/status/start")
+                        start_endpoint = f"/nodes/{node}/{vmtype}/{vmid}/status/start"
+                        try:
+                            start_result = api_request('POST', start_endpoint)
+                        except ProxmoxAPIError:
+                            # The rollback may not have fully settled yet; retry once shortly after
+                            time.sleep(0.1)
+                            start_result = api_request('POST', start_endpoint)
                         start_upid = start_result.get('data', '')
                         if start_upid:
                             wait_for_task(node, start_upid, "Start after rollback", name)
@@ -371,12 +395,16 @@ def main():
             except Exception as e:
                 notify("❌ Rollback Failed", str(e)[:50])
                 sys.exit(1)
+            finally:
+                # A rollback can change the power state too
+                drop_status_cache(vmid)
+                drop_resources_cache()
         
         else:
             notify("Proxmox Error", f"❌ Unknown action: {action}")
             
-    except urllib.error.HTTPError as e:
-        error_msg = e.read().decode('utf-8')[:50] if e.fp else str(e.code)
+    except ProxmoxAPIError as e:
+        error_msg = e.body[:50] or str(e.status)
         notify("Proxmox Error", f"❌ API Error: {error_msg}")
         
     except Exception as e:
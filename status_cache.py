@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Status Cache - Short-lived record of the last fetched VM/Container status
+Lets run_action reuse the status vm_actions just fetched instead of asking Proxmox again
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+# Entries older than this are dropped whenever the cache is rewritten
+STATUS_CACHE_PRUNE_AGE = 60
+
+def get_status_cache_file():
+    """Get path to the status cache file in Alfred's workflow data directory"""
+    data_dir = os.environ.get('alfred_workflow_data', '')
+    # Only use Alfred's data dir if it's for our workflow
+    if data_dir and 'com.pve.manager' in data_dir:
+        Path(data_dir).mkdir(parents=True, exist_ok=True)
+        return Path(data_dir) / 'status_cache.json'
+    return Path(__file__).parent.absolute() / 'status_cache.json'
+
+def _load_cache(cache_file):
+    """Load the whole cache, or an empty dict if it is missing or unreadable"""
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    except (ValueError, OSError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def read_status_cache(vmid, max_age):
+    """Return the cached status for vmid if it is younger than max_age seconds, else None"""
+    entry = _load_cache(get_status_cache_file()).get(str(vmid))
+    if isinstance(entry, dict) and time.time() - entry.get('ts', 0) < max_age:
+        return entry.get('status')
+    return None
+
+def _save_cache(cache_file, cache):
+    """Replace the cache file atomically, dropping entries too old to matter"""
+    now = time.time()
+    cache = {
+        key: entry for key, entry in cache.items()
+        if isinstance(entry, dict) and now - entry.get('ts', 0) < STATUS_CACHE_PRUNE_AGE
+    }
+    
+    # Per-process temp name, so overlapping runs never rename each other's file
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+
+def write_status_cache(vmid, status):
+    """Record the status for vmid"""
+    cache_file = get_status_cache_file()
+    cache = _load_cache(cache_file)
+    cache[str(vmid)] = {'status': status, 'ts': time.time()}
+    _save_cache(cache_file, cache)
+
+def drop_status_cache(vmid):
+    """Forget the cached status for vmid, e.g. after its power state changed"""
+    cache_file = get_status_cache_file()
+    cache = _load_cache(cache_file)
+    if cache.pop(str(vmid), None) is not None:
+        _save_cache(cache_file, cache)
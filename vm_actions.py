@@ -5,11 +5,38 @@ VM Actions Menu - Shows available actions for a selected VM/Container
 
 import json
 import sys
-import ssl
 import os
-import urllib.request
 from pathlib import Path
 
+from status_cache import read_status_cache, write_status_cache
+
+# Alfred re-runs this script on every keystroke, so reuse a status this recent
+STATUS_CACHE_TTL = 2
+
+# Every action item uses the same icon; the encoder never mutates it, so share one dict
+_ICON = {'path': 'icon.png'}
+
+# Action rows: (action key, emoji, label, description); {type} becomes "VM" or "Container"
+_POWER_ACTIONS_RUNNING = [
+    ('restart', '🔄', 'Restart', 'Reboot this {type}'),
+    ('shutdown', '⏻', 'Shutdown', 'Graceful shutdown (ACPI)'),
+    ('stop', '⏹️', 'Stop', 'Force stop (like pulling power)'),
+]
+_POWER_ACTIONS_STOPPED = [
+    ('start', '▶️', 'Start', 'Power on this {type}'),
+]
+
+# Remaining actions in menu order: (config toggle, only when running, action row)
+_OTHER_ACTIONS = [
+    ('action_ssh', True, ('ssh', '🔗', 'SSH', 'Connect via SSH in Terminal')),
+    # Web UI can view stopped VMs too
+    ('action_webui', False, ('webui', '🌐', 'Web UI', 'Open in Proxmox web interface')),
+    ('action_console', True, ('console', '🖥️', 'Console', 'Open web console directly')),
+    # Stopped VMs can be snapshotted and rolled back too
+    ('action_snapshot', False, ('snapshot', '📸', 'Snapshot', 'Create timestamped snapshot')),
+    ('action_rollback', False, ('rollback', '⏪', 'Rollback', 'Rollback to a snapshot')),
+]
+
 def get_usage_file():
     """Get path to action usage data file"""
     data_dir = os.environ.get('alfred_workflow_data', '')
@@ -22,13 +49,11 @@ def get_usage_file():
 def load_action_usage():
     """Load action usage counts from file"""
     usage_file = get_usage_file()
-    if usage_file.exists():
-        try:
-            with open(usage_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
-    return {}
+    try:
+        with open(usage_file, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return {}
 
 def get_config():
     """Get config from environment variables (set by Alfred at runtime)"""
@@ -57,25 +82,41 @@ def get_config():
     }
 
 def get_vm_status(node, vmtype, vmid):
-    """Get current status of a VM"""
+    """Get current status of a VM from Proxmox"""
+    # Only a status-cache miss gets here, so import these on demand
+    import ssl
+    import urllib.request
+    
     try:
         cfg = get_config()
         url = f"https://{cfg['host']}:{cfg['port']}/api2/json/nodes/{node}/{vmtype}/{vmid}/status/current"
         
-        ssl_ctx = ssl.create_default_context()
-        ssl_ctx.check_hostname = False
-        ssl_ctx.verify_mode = ssl.CERT_NONE
-        
         headers = {
             'Authorization': f"PVEAPIToken={cfg['token_id']}={cfg['token_secret']}"
         }
         
+        # Proxmox usually has a self-signed certificate; an unverified context
+        # also skips loading the system CA bundle
+        ssl_ctx = ssl._create_unverified_context()
+        
         req = urllib.request.Request(url, headers=headers)
         with urllib.request.urlopen(req, context=ssl_ctx, timeout=5) as resp:
-            data = json.loads(resp.read().decode('utf-8'))
-            return data.get('data', {}).get('status', 'unknown')
+            data = json.load(resp)
+            status = data.get('data', {}).get('status', 'unknown')
     except:
         return 'unknown'
+    
+    # Lets later keystrokes and run_action reuse this status
+    if status != 'unknown':
+        write_status_cache(vmid, status)
+    return status
+
+# Not proxmox_api.print_items: importing proxmox_api loads ssl and config, which this
+# script avoids on a status-cache hit. With only stdlib json here, ask for compact UTF-8
+def write_items(items):
+    """Write the Alfred script filter JSON to stdout as compact UTF-8"""
+    output = json.dumps({'items': items}, separators=(',', ':'), ensure_ascii=False)
+    sys.stdout.buffer.write(output.encode('utf-8'))
 
 def main():
     items = []
@@ -118,55 +159,45 @@ def main():
                 'subtitle': f'Unexpected format: {arg}',
                 'valid': False
             })
-            print(json.dumps({'items': items}))
+            write_items(items)
             return
         
         node, vmtype, vmid, name = parts[0], parts[1], parts[2], ':'.join(parts[3:])
         # In legacy mode, we don't support filtering because we can't separate the query from the name easily
         query = ""
+    # Most keystrokes reuse a recently cached status; only a miss needs a request,
+    # which runs in the background while the usage counts are read.
+    # action_usage is loaded once and shared by the usage sort and the query scoring below
+    status = read_status_cache(vmid, STATUS_CACHE_TTL)
+    if status is None:
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            status_future = executor.submit(get_vm_status, node, vmtype, vmid)
+            action_usage = load_action_usage()
+            status = status_future.result()
+    else:
+        action_usage = load_action_usage()
+    
     type_emoji = '📦' if vmtype == 'lxc' else '🖥️'
     type_label = 'Container' if vmtype == 'lxc' else 'VM'
-    
-    # Get current status
-    status = get_vm_status(node, vmtype, vmid)
     is_running = status == 'running'
     
     # Build action list based on status and config
-    actions = []
+    rows = []
     
     # Power actions (based on running state)
     if cfg.get('action_power', True):
-        if is_running:
-            actions.extend([
-                ('🔄', 'Restart', f'restart:{arg}', f'Reboot this {type_label}'),
-                ('⏻', 'Shutdown', f'shutdown:{arg}', 'Graceful shutdown (ACPI)'),
-                ('⏹️', 'Stop', f'stop:{arg}', 'Force stop (like pulling power)'),
-            ])
-        else:
-            actions.append(('▶️', 'Start', f'start:{arg}', f'Power on this {type_label}'))
+        rows.extend(_POWER_ACTIONS_RUNNING if is_running else _POWER_ACTIONS_STOPPED)
     
-    # SSH - only when running
-    if cfg.get('action_ssh', True) and is_running:
-        actions.append(('🔗', 'SSH', f'ssh:{arg}', 'Connect via SSH in Terminal'))
+    rows.extend(
+        row for toggle, running_only, row in _OTHER_ACTIONS
+        if cfg.get(toggle, True) and (is_running or not running_only)
+    )
     
-    # Web UI - always available (can view stopped VMs)
-    if cfg.get('action_webui', True):
-        actions.append(('🌐', 'Web UI', f'webui:{arg}', 'Open in Proxmox web interface'))
-    
-    # Console - only when running
-    if cfg.get('action_console', True) and is_running:
-        actions.append(('🖥️', 'Console', f'console:{arg}', 'Open web console directly'))
-    
-    # Snapshot - always available (can snapshot stopped VMs too)
-    if cfg.get('action_snapshot', True):
-        actions.append(('📸', 'Snapshot', f'snapshot:{arg}', 'Create timestamped snapshot'))
-    
-    # Rollback - always available
-    if cfg.get('action_rollback', True):
-        actions.append(('⏪', 'Rollback', f'rollback:{arg}', 'Rollback to a snapshot'))
+    actions = [(emoji, label, f'{key}:{arg}', desc.format(type=type_label)) for key, emoji, label, desc in rows]
     
     # Sort actions by usage count (most used first)
-    action_usage = load_action_usage()
     # Extract action name from arg (e.g., "restart:node:..." -> "restart")
     actions.sort(key=lambda x: -action_usage.get(x[2].split(':')[0], 0))
     
@@ -199,31 +230,27 @@ def main():
     
     elif query:
         query = query.lower().strip()
-        filtered_actions = []
+        # Score each matching action in a single pass, looking up its usage count once
+        scored = []
         for action in actions:
             # action tuple: (emoji, label, arg, desc)
             label_lower = action[1].lower()
-            desc_lower = action[3].lower()
+            if label_lower.startswith(query):
+                match_score = 2  # Best: starts with query
+            elif query in label_lower:
+                match_score = 1  # Good: contains query
+            elif query in action[3].lower():
+                match_score = 0  # Only the description matches
+            else:
+                continue
             
-            if query in label_lower or query in desc_lower:
-                # Calculate match score: starts with = 2, contains = 1
-                match_score = 0
-                if label_lower.startswith(query):
-                    match_score = 2  # Best: starts with query
-                elif query in label_lower:
-                    match_score = 1  # Good: contains query
-                
-                filtered_actions.append((action, match_score))
+            scored.append((action, match_score, -action_usage.get(action[2].split(':', 1)[0], 0)))
         
         # Sort by match score (descending), then by usage count (descending)
-        action_usage = load_action_usage()
-        filtered_actions.sort(key=lambda x: (
-            -x[1],  # Match score (higher = better match)
-            -action_usage.get(x[0][2].split(':')[0], 0)  # Usage count
-        ))
+        scored.sort(key=lambda t: (-t[1], t[2]))
         
         # Extract just the actions
-        actions = [a[0] for a in filtered_actions]
+        actions = [t[0] for t in scored]
     
     # Build items from actions
     for emoji, label, action_arg, desc in actions:
@@ -232,7 +259,7 @@ def main():
             'subtitle': desc,
             'arg': action_arg,
             'valid': True,
-            'icon': {'path': 'icon.png'}
+            'icon': _ICON
         }
         
         # Add autocomplete for Snapshot to allow entering description
@@ -263,7 +290,7 @@ def main():
             }
         items.append(item)
     
-    print(json.dumps({'items': items}))
+    write_items(items)
 
 if __name__ == '__main__':
     main()